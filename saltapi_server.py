@@ -4,35 +4,139 @@ Simple SaltStack API MCP Server - Manage Salt minions via salt-api
 """
 import os
 import sys
+import asyncio
+import importlib.util
 import logging
 import json
+import time
+from collections import namedtuple
+from contextlib import asynccontextmanager
+from operator import itemgetter
 from datetime import datetime, timezone
 import httpx
+import ijson
+import orjson
 from mcp.server.fastmcp import FastMCP
 
-# Configure logging to stderr
+# Configure logging to stderr; LOG_LEVEL=WARNING silences per-call INFO records
+LOG_LEVEL = logging.getLevelNamesMapping().get(
+    os.environ.get("LOG_LEVEL", "INFO").upper(), logging.INFO
+)
 logging.basicConfig(
-    level=logging.INFO,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     stream=sys.stderr
 )
 logger = logging.getLogger("saltapi-server")
 
+@asynccontextmanager
+async def _lifespan(server):
+    """Close the shared HTTP client on the server's own event loop at shutdown."""
+    try:
+        yield
+    finally:
+        await close_client()
+
 # Initialize MCP server - NO PROMPT PARAMETER!
-mcp = FastMCP("saltapi")
+mcp = FastMCP("saltapi", lifespan=_lifespan)
 
 # Configuration for PAM Authentication
 SALT_API_URL = os.environ.get("SALT_API_URL", "http://host.docker.internal:8000")
 SALT_API_USERNAME = os.environ.get("SALT_API_USERNAME", "")
 SALT_API_PASSWORD = os.environ.get("SALT_API_PASSWORD", "")
 
+# Let concurrent tool calls share one connection to an https salt-api when h2 is
+# installed; httpx only negotiates HTTP/2 via ALPN, so http URLs stay on HTTP/1.1
+HTTP2_ENABLED = importlib.util.find_spec("h2") is not None
+
+# Shared HTTP client so tool calls reuse pooled keep-alive connections
+_client = None
+_client_lock = asyncio.Lock()
+
+# Cached salt-api auth token; expiry is on the time.monotonic() clock
+_token = None
+_token_expiry = 0.0
+_token_lock = asyncio.Lock()
+TOKEN_REFRESH_MARGIN = 60  # Re-authenticate this many seconds before expiry
+TOKEN_DEFAULT_TTL = 300  # Used when salt-api does not report an expiry
+
+# Polling of local_async jobs
+JOB_POLL_DELAYS = (0.01, 0.05, 0.2, 0.5, 1.0)  # Backoff between lookups; the last one repeats
+JOB_TIMEOUT = 30  # Seconds to wait for all minions before returning partial results
+PING_TIMEOUT = 10
+FIND_JOB_AFTER = 2  # Seconds without new returns before asking pending minions about the job
+FIND_JOB_TIMEOUT = 5  # Salt-side timeout for that saltutil.find_job check
+NO_RETURN = "Minion did not return. [No response]"
+
+# Outcome of a local_async job: minion returns, minions confirmed to still be running it,
+# and targeted minions that did not return (offline, or not yet checked at the deadline)
+SaltJob = namedtuple("SaltJob", ["jid", "returns", "running", "missing"])
+
+MAX_RESULT_LINES = 20  # Lines of text output shown per minion
+
+# Cached union of sys.list_functions over the minions that are up, refreshed in the background.
+# Only a list every answering minion reported (complete) is trusted to reject a call.
+_known_funcs = frozenset()
+_known_funcs_complete = False
+_known_funcs_loaded_at = 0.0
+_known_funcs_expiry = 0.0
+_known_funcs_task = None
+KNOWN_FUNCS_TTL = 300
+KNOWN_FUNCS_MIN_AGE = 30  # A miss refreshes the list early, but at most this often
+
 # === UTILITY FUNCTIONS ===
 
+async def get_client():
+    """Return the shared salt-api HTTP client, creating it on first use."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        return _client
+
+    async with _client_lock:
+        if _client is None or _client.is_closed:
+            _client = httpx.AsyncClient(
+                base_url=SALT_API_URL,
+                verify=False,
+                http2=HTTP2_ENABLED,
+                timeout=30.0,
+                # httpx already negotiates gzip/deflate (and br when brotli is installed)
+                headers={"Accept": "application/json"},
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
+            )
+    return _client
+
+async def close_client():
+    """Close the shared salt-api HTTP client."""
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+def invalidate_salt_token(token=None):
+    """Drop the cached token (only if it still matches `token`, when given)."""
+    global _token, _token_expiry
+    if token is None or token == _token:
+        _token = None
+        _token_expiry = 0.0
+
 async def get_salt_token():
-    """Authenticate with salt-api and get token."""
+    """Get a salt-api token, authenticating only when the cached one is missing or expiring."""
     if not SALT_API_USERNAME or not SALT_API_PASSWORD:
         return None, "Salt API credentials not configured"
 
+    if _token and time.monotonic() < _token_expiry - TOKEN_REFRESH_MARGIN:
+        return _token, None
+
+    async with _token_lock:
+        # Another caller may have refreshed the token while we waited
+        if _token and time.monotonic() < _token_expiry - TOKEN_REFRESH_MARGIN:
+            return _token, None
+        return await _login()
+
+async def _login():
+    """Authenticate with salt-api and cache the returned token."""
+    global _token, _token_expiry
+
     auth_data = {
         "username": SALT_API_USERNAME,
         "password": SALT_API_PASSWORD,
@@ -40,49 +144,353 @@ async def get_salt_token():
     }
 
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            response = await client.post(
-                f"{SALT_API_URL}/login",
-                json=auth_data,
-                timeout=10
-            )
-            response.raise_for_status()
-            data = response.json()
-            token = data.get("return", [{}])[0].get("token", "")
-            return token, None
+        client = await get_client()
+        response = await client.post(
+            "/login",
+            json=auth_data,
+            timeout=10
+        )
+        response.raise_for_status()
+        data = response.json()
+        login = data.get("return", [{}])[0]
+        token = login.get("token", "")
+        if token:
+            # salt-api reports expiry as a wall-clock epoch timestamp
+            expire = login.get("expire")
+            ttl = expire - time.time() if isinstance(expire, (int, float)) else TOKEN_DEFAULT_TTL
+            _token = token
+            _token_expiry = time.monotonic() + ttl
+        return token, None
     except httpx.HTTPStatusError as e:
         return None, f"Authentication failed: {e.response.status_code}"
     except Exception as e:
         return None, f"Authentication error: {str(e)}"
 
-async def salt_api_request(endpoint, data=None, token=None):
-    """Make authenticated request to salt-api."""
+async def salt_api_request(endpoint, data=None, token=None, retry_auth=True):
+    """Make authenticated request to salt-api, re-authenticating once on 401."""
     headers = {}
     if token:
         headers["X-Auth-Token"] = token
 
     try:
-        async with httpx.AsyncClient(verify=False) as client:
-            if data:
-                response = await client.post(
-                    f"{SALT_API_URL}{endpoint}",
-                    headers=headers,
-                    json=data,
-                    timeout=30
-                )
+        client = await get_client()
+        if data:
+            response = await client.post(
+                endpoint,
+                headers=headers,
+                json=data
+            )
+        else:
+            response = await client.get(
+                endpoint,
+                headers=headers
+            )
+        response.raise_for_status()
+        return orjson.loads(response.content), None
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 401 and token and retry_auth:
+            # Cached token was revoked or expired server-side
+            invalidate_salt_token(token)
+            token, auth_error = await get_salt_token()
+            if auth_error:
+                return None, auth_error
+            return await salt_api_request(endpoint, data, token, retry_auth=False)
+        return None, f"API Error: {e.response.status_code} - {e.response.text}"
+    except Exception as e:
+        return None, f"Request error: {str(e)}"
+
+async def _find_running_minions(jid, minions, token, timeout):
+    """Return the subset of `minions` still running `jid`, or None if the check failed."""
+    data = {
+        "client": "local",
+        "tgt": ",".join(minions),
+        "tgt_type": "list",
+        "fun": "saltutil.find_job",
+        "arg": [jid],
+        "timeout": timeout,
+        "gather_job_timeout": timeout
+    }
+    result, error = await salt_api_request("/", data, token)
+    if error or not result or not result.get("return"):
+        logger.warning("Checking job %s on pending minions failed: %s", jid, error)
+        return None
+
+    # Minions running the job answer with its details; finished ones answer {} and
+    # offline ones do not answer at all
+    return {minion for minion, info in (result["return"][0] or {}).items() if info}
+
+async def run_salt_job(data, token, timeout=JOB_TIMEOUT):
+    """Start a local_async job and poll /jobs/<jid> until every live targeted minion has returned.
+
+    Like salt's own CLI, once returns stop coming in the pending minions are asked about the job
+    with saltutil.find_job, and only those still running it are waited for. Returns (SaltJob, error);
+    the job is None when salt-api returned no data. A failed poll is retried on the next backoff
+    step; the error is only reported if no poll succeeded before the deadline.
+    """
+    result, error = await salt_api_request("/", data, token)
+    if error:
+        return None, error
+
+    if not result or not result.get("return"):
+        return None, None
+
+    job = result["return"][0]
+    jid = job.get("jid") if job else None
+    if not jid:
+        # No minions matched the target
+        return SaltJob(None, {}, [], []), None
+    targeted = job.get("minions", [])
+
+    waiting = set(targeted)
+    running = set()
+    returns = {}
+    polled = False
+    poll_error = None
+    deadline = time.monotonic() + timeout
+    last_progress = time.monotonic()
+    attempt = 0
+    while True:
+        delay = JOB_POLL_DELAYS[min(attempt, len(JOB_POLL_DELAYS) - 1)]
+        await asyncio.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        attempt += 1
+
+        result, error = await salt_api_request(f"/jobs/{jid}", None, token)
+        if error:
+            # Keep the returns collected so far; the job is still running on the master
+            poll_error = error
+            logger.warning("Polling job %s failed: %s", jid, error)
+        else:
+            polled = True
+            if result and result.get("return"):
+                latest = result["return"][0] or {}
+                if len(latest) > len(returns):
+                    last_progress = time.monotonic()
+                returns = latest
+
+            if waiting.issubset(returns):
+                missing = [minion for minion in targeted if minion not in returns]
+                return SaltJob(jid, returns, [], missing), None
+
+            now = time.monotonic()
+            remaining = int(deadline - now)
+            if now - last_progress >= FIND_JOB_AFTER and remaining >= 1:
+                pending = [minion for minion in waiting if minion not in returns]
+                found = await _find_running_minions(jid, pending, token, min(FIND_JOB_TIMEOUT, remaining))
+                if found is not None:
+                    # Stop waiting on offline minions; the next poll picks up any late returns
+                    running = found
+                    waiting = {minion for minion in waiting if minion in returns or minion in found}
+                # Re-check the minions still running after another quiet spell
+                last_progress = time.monotonic()
+        if time.monotonic() >= deadline:
+            break
+
+    if not polled:
+        return None, poll_error
+
+    pending = [minion for minion in targeted if minion not in returns]
+    still_running = [minion for minion in pending if minion in running]
+    missing = [minion for minion in pending if minion not in running]
+    logger.info("Job %s: %d minion(s) still running, %d without a return after %ss",
+                jid, len(still_running), len(missing), timeout)
+    return SaltJob(jid, returns, still_running, missing), None
+
+async def _refresh_known_functions(token):
+    """Reload the cached function list with one synchronous call, off the request path."""
+    global _known_funcs, _known_funcs_complete, _known_funcs_loaded_at, _known_funcs_expiry
+    # The local client only waits for live minions (salt drops offline ones after its
+    # find_job check), so the union covers exactly the minions that are up
+    data = {
+        "client": "local",
+        "tgt": "*",
+        "fun": "sys.list_functions",
+        "timeout": FIND_JOB_TIMEOUT,
+        "gather_job_timeout": FIND_JOB_TIMEOUT
+    }
+    try:
+        # A 401 here usually means an eauth ACL that forbids this target, not an expired
+        # token, so do not drop the shared token over it
+        result, error = await salt_api_request("/", data, token, retry_auth=False)
+    except Exception as e:
+        result, error = None, str(e)
+
+    known = set()
+    complete = False
+    if error or not result or not result.get("return"):
+        logger.warning("Could not load Salt function list: %s", error)
+    else:
+        # A minion that fails the call returns a string, which leaves the union incomplete
+        complete = True
+        for functions in (result["return"][0] or {}).values():
+            if isinstance(functions, list):
+                known.update(functions)
             else:
-                response = await client.get(
-                    f"{SALT_API_URL}{endpoint}",
-                    headers=headers,
-                    timeout=30
-                )
+                complete = False
+
+    _known_funcs = frozenset(known)
+    _known_funcs_complete = complete and bool(known)
+    _known_funcs_loaded_at = time.monotonic()
+    _known_funcs_expiry = _known_funcs_loaded_at + KNOWN_FUNCS_TTL
+
+def is_unknown_function(function, token):
+    """Tell whether `function` is definitely not available on any minion.
+
+    Never waits on salt-api: a stale list is refreshed in the background and, until a complete
+    list is cached, every function is let through to salt-api.
+    """
+    global _known_funcs_task
+    now = time.monotonic()
+    unknown = _known_funcs_complete and function not in _known_funcs
+
+    # A miss may be a module synced since the last refresh, so reload early
+    stale = now >= _known_funcs_expiry or (unknown and now >= _known_funcs_loaded_at + KNOWN_FUNCS_MIN_AGE)
+    if stale and (_known_funcs_task is None or _known_funcs_task.done()):
+        _known_funcs_task = asyncio.create_task(_refresh_known_functions(token))
+
+    return unknown
+
+class _ResponseReader:
+    """Adapt a streamed httpx response to the async file interface ijson reads from."""
+
+    def __init__(self, response):
+        self._chunks = response.aiter_bytes()
+
+    async def read(self, size=-1):
+        if size == 0:
+            # ijson probes with read(0) to detect bytes vs str input
+            return b""
+        return await anext(self._chunks, b"")
+
+async def salt_api_stream(endpoint, data, token, consume, retry_auth=True):
+    """POST to salt-api and hand the response body to `consume` as it streams in."""
+    headers = {}
+    if token:
+        headers["X-Auth-Token"] = token
+
+    try:
+        client = await get_client()
+        async with client.stream("POST", endpoint, headers=headers, json=data) as response:
+            if response.is_error:
+                # Buffer the error body so it can be reported below
+                await response.aread()
             response.raise_for_status()
-            return response.json(), None
+            return await consume(_ResponseReader(response)), None
     except httpx.HTTPStatusError as e:
+        if e.response.status_code == 401 and token and retry_auth:
+            # Cached token was revoked or expired server-side
+            invalidate_salt_token(token)
+            token, auth_error = await get_salt_token()
+            if auth_error:
+                return None, auth_error
+            return await salt_api_stream(endpoint, data, token, consume, retry_auth=False)
         return None, f"API Error: {e.response.status_code} - {e.response.text}"
     except Exception as e:
         return None, f"Request error: {str(e)}"
 
+async def _parse_minion_status(stream):
+    """Collect the up/down minion lists of a manage.status response, or None if empty."""
+    status = None
+    async for prefix, event, value in ijson.parse_async(stream):
+        if prefix == "return.item.up.item":
+            status["up"].append(value)
+        elif prefix == "return.item.down.item":
+            status["down"].append(value)
+        elif prefix == "return.item" and status is None and event == "start_map":
+            status = {"up": [], "down": []}
+    return status
+
+async def _parse_minion_grains(stream, minion_ids):
+    """Pick the wanted minions' grains out of a grains.items response.
+
+    Returns (matched_any, {minion_id: grains}), where matched_any tells whether any minion replied.
+    """
+    matched_any = False
+    grains = {}
+    async for minion, minion_grains in ijson.kvitems_async(stream, "return.item", use_float=True):
+        matched_any = True
+        if minion in minion_ids:
+            grains[minion] = minion_grains
+    return matched_any, grains
+
+# Output fragments reused by the minion list loops
+_BULLET_B = "  • ".encode()
+_NL_B = b"\n"
+_ONLINE_B = b" - Online"
+
+class _Buf:
+    """Accumulate output lines as UTF-8 bytes and decode once at the end."""
+    __slots__ = ("b",)
+
+    def __init__(self):
+        self.b = bytearray()
+
+    def line(self, s=""):
+        self.b += s.encode()
+        self.b += _NL_B
+
+    def json(self, value, indent=b"  "):
+        """Write `value` as indented JSON straight from orjson's bytes."""
+        self.b += indent
+        self.b += orjson.dumps(value, option=orjson.OPT_INDENT_2)
+        self.b += _NL_B
+
+    def bullets(self, items, suffix=b""):
+        """Write a "  • <item><suffix>" line for each item."""
+        b = self.b
+        tail = suffix + _NL_B
+        for item in items:
+            b += _BULLET_B
+            b += item.encode()
+            b += tail
+
+    def text(self):
+        # Drop the final newline, matching "\n".join() of the same lines
+        return str(memoryview(self.b)[:-1], "utf-8")
+
+# Grains shown by the minion info tools, with the value used when a grain is missing
+_GRAIN_KEYS = ('os', 'osrelease', 'osarch', 'kernel', 'fqdn', 'id',
+               'num_cpus', 'mem_total', 'ipv4', 'ip4_interfaces', 'saltversion', 'master')
+_GRAIN_DEFAULTS = ('Unknown', '', 'Unknown', 'Unknown', None, 'Unknown',
+                   None, None, None, None, 'Unknown', 'Unknown')
+
+def _format_minion_info(output, minion_id, grains):
+    """Write the key grains of one minion to `output`."""
+    (os_name, osrelease, osarch, kernel, fqdn, grain_id,
+     num_cpus, mem_total, ipv4, ip4_interfaces, saltversion, master) = map(grains.get, _GRAIN_KEYS, _GRAIN_DEFAULTS)
+
+    output.line(f"🖥️ Minion Information: {minion_id}\n")
+
+    # Basic system info
+    output.line("💻 System Information:")
+    output.line(f"  • OS: {os_name} {osrelease}")
+    output.line(f"  • Architecture: {osarch}")
+    output.line(f"  • Kernel: {kernel}")
+    output.line(f"  • Hostname: {fqdn if fqdn is not None else grain_id}")
+    output.line()
+
+    # Hardware info
+    if num_cpus or mem_total:
+        output.line("⚡ Hardware:")
+        if num_cpus:
+            output.line(f"  • CPUs: {num_cpus}")
+        if mem_total:
+            mem_gb = round(mem_total / 1024, 1)
+            output.line(f"  • Memory: {mem_gb} GB")
+        output.line()
+
+    # Network info
+    if ip4_interfaces or ipv4:
+        output.line("🌐 Network:")
+        ips = [ip for ip in ipv4 or () if ip != '127.0.0.1']
+        if ips:
+            output.line("  • IP: " + "\n  • IP: ".join(ips))
+        output.line()
+
+    # Salt info
+    output.line("🧂 Salt Information:")
+    output.line(f"  • Salt Version: {saltversion}")
+    output.line(f"  • Master: {master}")
+
 # === MCP TOOLS ===
 
 @mcp.tool()
@@ -95,53 +503,53 @@ async def list_all_minions() -> str:
         if auth_error:
             return f"❌ Authentication Error: {auth_error}"
 
-        # Get minion list using salt-run manage.list_all
+        # manage.up/manage.down each run manage.status, so one call gives a consistent snapshot
         data = {
             "client": "runner",
             "fun": "manage.status"
         }
-        result, error = await salt_api_request("/", data, token)
+        minion_data, error = await salt_api_stream("/", data, token, _parse_minion_status)
         if error:
             return f"❌ API Error: {error}"
 
-        if not result or not result.get("return"):
+        if not minion_data:
             return "❌ Error: No data returned from Salt API"
 
-        minion_data = result["return"][0]
+        up_minions = minion_data["up"]
+        down_minions = minion_data["down"]
 
         # Format the response
-        output = ["📊 Salt Minions Status:\n"]
+        output = _Buf()
+        output.line("📊 Salt Minions Status:\n")
 
         # Online minions
-        up_minions = minion_data.get("up", [])
+        up_minions.sort()
         if up_minions:
-            output.append(f"✅ Online Minions ({len(up_minions)}):")
-            for minion in sorted(up_minions):
-                output.append(f"  • {minion}")
-            output.append("")
+            output.line(f"✅ Online Minions ({len(up_minions)}):")
+            output.bullets(up_minions)
+            output.line()
 
         # Offline minions
-        down_minions = minion_data.get("down", [])
+        down_minions.sort()
         if down_minions:
-            output.append(f"❌ Offline Minions ({len(down_minions)}):")
-            for minion in sorted(down_minions):
-                output.append(f"  • {minion}")
-            output.append("")
+            output.line(f"❌ Offline Minions ({len(down_minions)}):")
+            output.bullets(down_minions)
+            output.line()
 
         # Summary
         total = len(up_minions) + len(down_minions)
-        output.append(f"📈 Summary: {len(up_minions)} online, {len(down_minions)} offline, {total} total")
+        output.line(f"📈 Summary: {len(up_minions)} online, {len(down_minions)} offline, {total} total")
 
-        return "\n".join(output)
+        return output.text()
 
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
         return f"❌ Error: {str(e)}"
 
 @mcp.tool()
 async def ping_minions(target: str = "*") -> str:
     """Test connectivity to Salt minions using test.ping function."""
-    logger.info(f"Executing ping_minions with target: {target}")
+    logger.info("Executing ping_minions with target: %s", target)
 
     if not target.strip():
         target = "*"
@@ -153,64 +561,72 @@ async def ping_minions(target: str = "*") -> str:
 
         # Execute test.ping on minions
         data = {
-            "client": "local",
+            "client": "local_async",
             "tgt": target,
             "fun": "test.ping"
         }
 
-        result, error = await salt_api_request("/", data, token)
+        job, error = await run_salt_job(data, token, timeout=PING_TIMEOUT)
         if error:
             return f"❌ API Error: {error}"
 
-        if not result or not result.get("return"):
+        if job is None:
             return "❌ Error: No data returned from Salt API"
 
-        ping_results = result["return"][0]
+        # Minions that did not answer the ping in time are reported as unreachable
+        ping_results = job.returns
+        for minion in job.running + job.missing:
+            ping_results[minion] = NO_RETURN
 
         # Format the response
-        output = [f"🔍 Ping Results for target '{target}':\n"]
+        output = _Buf()
+        output.line(f"🔍 Ping Results for target '{target}':\n")
 
         if not ping_results:
-            output.append("⚠️ No minions matched the target or responded")
-            return "\n".join(output)
+            output.line("⚠️ No minions matched the target or responded")
+            return output.text()
 
+        # Partition in a single pass over the results, then sort the compact lists
         responding = []
         not_responding = []
+        add_responding = responding.append
+        add_not_responding = not_responding.append
 
         for minion, response in ping_results.items():
             if response is True:
-                responding.append(minion)
+                add_responding(minion)
             else:
-                not_responding.append((minion, response))
+                add_not_responding((minion, response))
+        responding.sort()
+        not_responding.sort(key=itemgetter(0))
 
         # Show responding minions
         if responding:
-            output.append(f"✅ Responding Minions ({len(responding)}):")
-            for minion in sorted(responding):
-                output.append(f"  • {minion} - Online")
-            output.append("")
+            output.line(f"✅ Responding Minions ({len(responding)}):")
+            output.bullets(responding, _ONLINE_B)
+            output.line()
 
         # Show non-responding minions
         if not_responding:
-            output.append(f"❌ Non-responding Minions ({len(not_responding)}):")
+            output.line(f"❌ Non-responding Minions ({len(not_responding)}):")
             for minion, response in not_responding:
-                output.append(f"  • {minion} - {response}")
-            output.append("")
+                output.line(f"  • {minion} - {response}")
+            output.line()
 
         # Summary
         total_targeted = len(ping_results)
-        output.append(f"📊 Summary: {len(responding)} responding, {len(not_responding)} not responding, {total_targeted} total targeted")
+        output.line(f"📊 Summary: {len(responding)} responding, {len(not_responding)} not responding, {total_targeted} total targeted")
 
-        return "\n".join(output)
+        return output.text()
 
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
         return f"❌ Error: {str(e)}"
 
 @mcp.tool()
 async def get_minion_info(minion_id: str = "") -> str:
     """Get detailed information about a specific Salt minion."""
-    logger.info(f"Executing get_minion_info for minion: {minion_id}")
+    logger.info("Executing get_minion_info for minion: %s", minion_id)
 
     if not minion_id.strip():
         return "❌ Error: Minion ID is required"
@@ -227,62 +643,83 @@ async def get_minion_info(minion_id: str = "") -> str:
             "fun": "grains.items"
         }
 
-        result, error = await salt_api_request("/", data, token)
+        result, error = await salt_api_stream(
+            "/", data, token, lambda stream: _parse_minion_grains(stream, {minion_id})
+        )
         if error:
             return f"❌ API Error: {error}"
 
-        if not result or not result.get("return") or not result["return"][0]:
+        matched_any, minion_grains = result
+        if not matched_any:
             return f"❌ Error: Minion '{minion_id}' not found or not responding"
 
-        grains = result["return"][0].get(minion_id)
+        grains = minion_grains.get(minion_id)
         if not grains:
             return f"❌ Error: No data available for minion '{minion_id}'"
 
         # Format key information
-        output = [f"🖥️ Minion Information: {minion_id}\n"]
-
-        # Basic system info
-        output.append("💻 System Information:")
-        output.append(f"  • OS: {grains.get('os', 'Unknown')} {grains.get('osrelease', '')}")
-        output.append(f"  • Architecture: {grains.get('osarch', 'Unknown')}")
-        output.append(f"  • Kernel: {grains.get('kernel', 'Unknown')}")
-        output.append(f"  • Hostname: {grains.get('fqdn', grains.get('id', 'Unknown'))}")
-        output.append("")
-
-        # Hardware info
-        if grains.get('num_cpus') or grains.get('mem_total'):
-            output.append("⚡ Hardware:")
-            if grains.get('num_cpus'):
-                output.append(f"  • CPUs: {grains['num_cpus']}")
-            if grains.get('mem_total'):
-                mem_gb = round(grains['mem_total'] / 1024, 1)
-                output.append(f"  • Memory: {mem_gb} GB")
-            output.append("")
-
-        # Network info
-        if grains.get('ip4_interfaces') or grains.get('ipv4'):
-            output.append("🌐 Network:")
-            if grains.get('ipv4'):
-                for ip in grains['ipv4']:
-                    if ip != '127.0.0.1':
-                        output.append(f"  • IP: {ip}")
-            output.append("")
-
-        # Salt info
-        output.append("🧂 Salt Information:")
-        output.append(f"  • Salt Version: {grains.get('saltversion', 'Unknown')}")
-        output.append(f"  • Master: {grains.get('master', 'Unknown')}")
-
-        return "\n".join(output)
+        output = _Buf()
+        _format_minion_info(output, minion_id, grains)
+        return output.text()
 
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
+        return f"❌ Error: {str(e)}"
+
+@mcp.tool()
+async def get_minions_info(minion_ids: list[str] | None = None) -> str:
+    """Get detailed information about several Salt minions in a single request."""
+    logger.info("Executing get_minions_info for minions: %s", minion_ids)
+
+    # Drop blanks and duplicates, keeping the requested order
+    minion_ids = list(dict.fromkeys(m.strip() for m in minion_ids or () if m.strip()))
+    if not minion_ids:
+        return "❌ Error: At least one minion ID is required"
+
+    try:
+        token, auth_error = await get_salt_token()
+        if auth_error:
+            return f"❌ Authentication Error: {auth_error}"
+
+        # Get grains for all minions with one list-targeted call
+        data = {
+            "client": "local",
+            "tgt": ",".join(minion_ids),
+            "tgt_type": "list",
+            "fun": "grains.items"
+        }
+
+        wanted = set(minion_ids)
+        result, error = await salt_api_stream(
+            "/", data, token, lambda stream: _parse_minion_grains(stream, wanted)
+        )
+        if error:
+            return f"❌ API Error: {error}"
+
+        matched_any, minion_grains = result
+        if not matched_any:
+            return "❌ Error: None of the requested minions were found or responding"
+
+        output = _Buf()
+        for i, minion_id in enumerate(minion_ids):
+            if i:
+                output.line()
+            grains = minion_grains.get(minion_id)
+            if grains:
+                _format_minion_info(output, minion_id, grains)
+            else:
+                output.line(f"❌ No data available for minion '{minion_id}'")
+
+        return output.text()
+
+    except Exception as e:
+        logger.error("Error: %s", e)
         return f"❌ Error: {str(e)}"
 
 @mcp.tool()
 async def execute_salt_command(target: str = "*", function: str = "", args: str = "") -> str:
     """Execute a Salt function on specified minions."""
-    logger.info(f"Executing salt command: {function} on {target}")
+    logger.info("Executing salt command: %s on %s", function, target)
 
     if not target.strip():
         target = "*"
@@ -295,9 +732,13 @@ async def execute_salt_command(target: str = "*", function: str = "", args: str
         if auth_error:
             return f"❌ Authentication Error: {auth_error}"
 
+        # Reject typos and unavailable functions before dispatching a job
+        if is_unknown_function(function, token):
+            return f"❌ Error: Unknown Salt function '{function}'"
+
         # Prepare the salt command
         data = {
-            "client": "local",
+            "client": "local_async",
             "tgt": target,
             "fun": function
         }
@@ -314,52 +755,71 @@ async def execute_salt_command(target: str = "*", function: str = "", args: str
             except json.JSONDecodeError:
                 data["arg"] = [args]
 
-        result, error = await salt_api_request("/", data, token)
+        job, error = await run_salt_job(data, token)
         if error:
             return f"❌ API Error: {error}"
 
-        if not result or not result.get("return"):
+        if job is None:
             return "❌ Error: No data returned from Salt API"
 
-        command_results = result["return"][0]
+        command_results = job.returns
 
         # Format the response
-        output = [f"⚡ Salt Command Results: {function}\n"]
-        output.append(f"🎯 Target: {target}")
+        output = _Buf()
+        output.line(f"⚡ Salt Command Results: {function}\n")
+        output.line(f"🎯 Target: {target}")
         if args.strip():
-            output.append(f"📝 Arguments: {args}")
-        output.append("")
+            output.line(f"📝 Arguments: {args}")
+        output.line()
 
-        if not command_results:
-            output.append("⚠️ No minions matched the target or responded")
-            return "\n".join(output)
+        if not command_results and not job.running and not job.missing:
+            output.line("⚠️ No minions matched the target or responded")
+            return output.text()
 
         # Show results for each minion
         for minion, minion_result in command_results.items():
-            output.append(f"📍 {minion}:")
+            output.line(f"📍 {minion}:")
             if isinstance(minion_result, (dict, list)):
-                output.append(f"  {json.dumps(minion_result, indent=2)}")
+                output.json(minion_result)
             else:
-                # Handle multiline output
+                # Handle multiline output, scanning only the lines that are shown
                 result_str = str(minion_result)
-                if '\n' in result_str:
-                    lines = result_str.split('\n')
-                    for line in lines[:20]:  # Limit output
-                        output.append(f"  {line}")
-                    if len(lines) > 20:
-                        output.append(f"  ... ({len(lines) - 20} more lines)")
-                else:
-                    output.append(f"  {result_str}")
-            output.append("")
-
-        return "\n".join(output)
+                start = 0
+                for _ in range(MAX_RESULT_LINES):
+                    end = result_str.find('\n', start)
+                    if end < 0:
+                        output.line(f"  {result_str[start:]}")
+                        start = -1
+                        break
+                    output.line(f"  {result_str[start:end]}")
+                    start = end + 1
+                if start >= 0:
+                    remaining = result_str.count('\n', start) + 1
+                    output.line(f"  ... ({remaining} more lines)")
+            output.line()
+
+        # Only minions confirmed to still run the command get the job id to look up later
+        if job.missing:
+            output.line(f"⚠️ No return yet from {len(job.missing)} minion(s): {', '.join(sorted(job.missing))}")
+        if job.running:
+            output.line(f"⏳ Still running on {len(job.running)} minion(s): {', '.join(sorted(job.running))}")
+            output.line(f"🔖 Job ID: {job.jid} (check later with jobs.lookup_jid)")
+
+        return output.text()
 
     except Exception as e:
-        logger.error(f"Error: {e}")
+        logger.error("Error: %s", e)
         return f"❌ Error: {str(e)}"
 
 # === SERVER STARTUP ===
 if __name__ == "__main__":
+    # Prefer the libuv-based event loop when available
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+
     logger.info("Starting SaltStack API MCP server...")
 
     # Startup checks
@@ -371,15 +831,24 @@ if __name__ == "__main__":
     logger.info("Hello")
 
     # Optional: test token at startup
-    import asyncio
+    async def _startup_check():
+        try:
+            return await get_salt_token()
+        finally:
+            # The server runs on a fresh event loop, so drop connections bound to this one
+            await close_client()
+
     try:
-        output = asyncio.run(list_all_minions())
-        logger.info(f"Initial minion list output:\n{output}")
+        token, auth_error = asyncio.run(_startup_check())
+        if token:
+            logger.info("Token OK")
+        else:
+            logger.warning("Token test failed: %s", auth_error)
     except Exception as e:
-        logger.error(f"Token test failed: {e}")
+        logger.error("Token test failed: %s", e)
 
     try:
         mcp.run(transport='stdio')
     except Exception as e:
-        logger.error(f"Server error: {e}", exc_info=True)
+        logger.error("Server error: %s", e, exc_info=True)
         sys.exit(1)